@@ -1,220 +1,688 @@
 from __future__ import annotations
 
-import json
+import asyncio
+import atexit
+import copy
+import functools
+import gzip
+import hashlib
 import os
-import time
+import random
+import re
+import warnings
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import Any, Dict, List, Optional
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
 
-import requests
+import httpx
+import orjson
+
+from agents.llm_cache import DiskCache, cache_key
 
 
 class LLMError(RuntimeError):
-    pass
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status  # HTTP status when the provider answered with an error
+
+
+RETRYABLE_STATUS = frozenset({429, 500, 502, 503, 504})
+
+# below this, gzip framing costs more than it saves
+GZIP_MIN_BYTES = 1024
+
+
+_singleton: Optional["OpenAICompatibleClient"] = None
+
+MEMO_MAX_ENTRIES = 128
+
+# {"path", "content"} entries, shared by every agent that produces files
+FILE_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "path": {"type": "string", "description": "relative path, e.g. app/main.py"},
+        "content": {"type": "string", "description": "full file content"},
+    },
+    "required": ["path", "content"],
+}
+
+FILES_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {"files": {"type": "array", "items": FILE_SCHEMA}},
+    "required": ["files"],
+}
 
 
-@dataclass
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Retry-After is either a number of seconds or an HTTP date.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return max(0.0, (when - datetime.now(timezone.utc)).total_seconds())
+
+
+@dataclass(frozen=True)
 class LLMConfig:
     base_url: str
     api_key: str
     model: str = "gpt-4o-mini"
     timeout_s: int = 90
     max_retries: int = 2
+    backoff_base_s: float = 0.5
+    backoff_max_s: float = 30.0
+    max_concurrency: int = 4
+    cache_dir: Optional[str] = None  # exact-match response cache, disabled when None
+    json_mode: bool = True  # send response_format; turned off per client if the provider rejects it
+    stream: bool = True  # read completions as server-sent events
+    compress_requests: bool = False  # gzip large request bodies (dropped automatically on HTTP 415)
 
 
 class OpenAICompatibleClient:
     """
     Client minimal OpenAI-compatible (works for OpenAI OR GitHub Models if endpoint is compatible).
     Uses: POST {base_url}/chat/completions
+    Async: one httpx.AsyncClient per instance, and at most cfg.max_concurrency requests in flight.
+    Use OpenAICompatibleClient.instance() to share one connection pool across all agents.
+    The pool belongs to the event loop that first used it: close it (await aclose(), or
+    "async with client:") before that loop ends, since a finished loop cannot close its sockets.
     """
-    def __init__(self, cfg: LLMConfig):
+    def __init__(self, cfg: LLMConfig, transport: Optional[httpx.AsyncBaseTransport] = None):
         self.cfg = cfg
+        self._transport = transport  # e.g. httpx.MockTransport in tests; None = real network
+        self._url = cfg.base_url.rstrip("/") + "/chat/completions"
+        # the pool and the semaphore both belong to one event loop; see _bind_loop()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._http: Optional[httpx.AsyncClient] = None
+        self._sem: Optional[asyncio.Semaphore] = None
+        self._cache = DiskCache(cfg.cache_dir) if cfg.cache_dir else None
+        self._compress = cfg.compress_requests
+        # cleared by BaseAgent.ask_json when the provider answers 400 to response_format
+        self.json_mode = cfg.json_mode
 
-    def chat(self, messages: List[Dict[str, str]], temperature: float = 0.2) -> str:
-        url = self.cfg.base_url.rstrip("/") + "/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {self.cfg.api_key}",
-            "Content-Type": "application/json",
-        }
+    def _bind_loop(self) -> None:
+        # A later asyncio.run() (e.g. agents rebuilt per request) gets a fresh pool and semaphore:
+        # the old ones are tied to a loop that no longer runs.
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            if self._http is not None and not self._http.is_closed:
+                # its sockets can only be closed from the loop that opened them, which is gone
+                warnings.warn(
+                    "OpenAICompatibleClient reused in a new event loop without aclose(): "
+                    "the previous connection pool is dropped unclosed",
+                    ResourceWarning,
+                    stacklevel=3,
+                )
+            self._loop = loop
+            self._http = None
+            self._sem = None
+
+    @property
+    def sem(self) -> asyncio.Semaphore:
+        self._bind_loop()
+        if self._sem is None:
+            self._sem = asyncio.Semaphore(self.cfg.max_concurrency)
+        return self._sem
+
+    @property
+    def http(self) -> httpx.AsyncClient:
+        # created lazily so it binds to the running event loop
+        self._bind_loop()
+        if self._http is None or self._http.is_closed:
+            self._http = httpx.AsyncClient(
+                headers={
+                    "Authorization": f"Bearer {self.cfg.api_key}",
+                    "Content-Type": "application/json",
+                },
+                timeout=self.cfg.timeout_s,
+                # keep-alive pool shared by every agent using this client (no TLS handshake per call);
+                # httpx already sends Accept-Encoding: gzip, deflate and decompresses responses
+                limits=httpx.Limits(max_connections=16, max_keepalive_connections=4),
+                transport=self._transport,
+            )
+        return self._http
+
+    @classmethod
+    def instance(cls) -> "OpenAICompatibleClient":
+        """
+        Process-wide client built from the env config on first use; closed at interpreter exit.
+        """
+        global _singleton
+        if _singleton is None:
+            _singleton = cls(load_llm_config_from_env())
+            atexit.register(_singleton.close)
+        return _singleton
+
+    async def __aenter__(self) -> "OpenAICompatibleClient":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        if self._http is not None:
+            await self._http.aclose()
+        self._http = None
+        self._sem = None
+        self._loop = None
+
+    def close(self) -> None:
+        """
+        Sync variant of aclose() for atexit. Prefer awaiting aclose() inside the event loop:
+        once that loop is gone the pooled sockets cannot be closed cleanly and die with the process.
+        """
+        if self._http is None or self._http.is_closed:
+            return
+        try:
+            asyncio.run(self.aclose())
+        except RuntimeError:
+            self._http = None
+
+    def _backoff_s(self, attempt: int, retry_after: Optional[float] = None) -> float:
+        # exponential backoff + jitter, unless the server told us how long to wait
+        if retry_after is not None:
+            return min(retry_after, self.cfg.backoff_max_s)
+        delay = self.cfg.backoff_base_s * (2 ** attempt) + random.uniform(0, 1)
+        return min(delay, self.cfg.backoff_max_s)
+
+    @staticmethod
+    async def _read_stream(resp: httpx.Response) -> str:
+        # Server-sent events: "data: {chunk}" lines, terminated by "data: [DONE]".
+        # Read to the end even once the JSON is complete: leaving the stream early makes httpcore
+        # drop the connection instead of returning it to the keep-alive pool.
+        parts: List[str] = []
+        async for line in resp.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                continue
+            choices = orjson.loads(data).get("choices")
+            delta = (choices[0].get("delta") or {}).get("content") if choices else None
+            if delta:
+                parts.append(delta)
+        return "".join(parts)
+
+    async def _post(self, body: bytes) -> Tuple[httpx.Response, str]:
+        """
+        One POST to the completions endpoint; content is "" for error statuses (body is read for the message).
+        """
+        headers = None
+        if self._compress and len(body) >= GZIP_MIN_BYTES:
+            body = gzip.compress(body)
+            headers = {"Content-Encoding": "gzip"}
+        content = ""
+        async with self.sem:
+            async with self.http.stream("POST", self._url, content=body, headers=headers) as resp:
+                if resp.status_code >= 400:
+                    await resp.aread()
+                elif self.cfg.stream:
+                    content = await self._read_stream(resp)
+                else:
+                    data = orjson.loads(await resp.aread())
+                    content = data["choices"][0]["message"]["content"]
+        return resp, content
+
+    async def chat(
+        self,
+        messages: List[Dict[str, str]],
+        temperature: float = 0.2,
+        response_format: Optional[Dict[str, Any]] = None,
+        validate: Optional[Callable[[str], Any]] = None,
+    ) -> str:
+        """
+        validate: raises ValueError for an unusable answer (e.g. JSON expected but prose or a cut-off
+        stream received). That error goes to the caller and the answer is not cached. A cached
+        answer that fails it is ignored and fetched again.
+        """
         payload = {
             "model": self.cfg.model,
             "messages": messages,
             "temperature": temperature,
         }
+        if response_format is not None:
+            payload["response_format"] = response_format
+
+        key = None
+        if self._cache:
+            key = cache_key(payload)
+            cached = self._cache.get(key)
+            if cached is not None:
+                try:
+                    if validate is not None:
+                        validate(cached)
+                    return cached
+                except ValueError:
+                    pass  # stored before it was validated: ask again
+        if self.cfg.stream:
+            payload["stream"] = True
+        body = orjson.dumps(payload)
 
         last_err: Optional[Exception] = None
         for attempt in range(self.cfg.max_retries + 1):
+            retry_after: Optional[float] = None
             try:
-                resp = requests.post(url, headers=headers, json=payload, timeout=self.cfg.timeout_s)
-                if resp.status_code >= 400:
-                    raise LLMError(f"LLM HTTP {resp.status_code}: {resp.text[:500]}")
-                data = resp.json()
-                return data["choices"][0]["message"]["content"]
-            except Exception as e:
+                resp, content = await self._post(body)
+                if resp.status_code == 415 and self._compress and len(body) >= GZIP_MIN_BYTES:
+                    # endpoint rejects compressed bodies: resend plain (not counted as a retry) and stop trying
+                    self._compress = False
+                    resp, content = await self._post(body)
+            except httpx.TransportError as e:  # timeouts, connection resets, DNS...
                 last_err = e
-                # backoff simple
-                time.sleep(0.6 * (attempt + 1))
+            else:
+                if resp.status_code < 400:
+                    if validate is not None:
+                        validate(content)
+                    if key and content:
+                        self._cache.set(key, content)
+                    return content
+                last_err = LLMError(f"LLM HTTP {resp.status_code}: {resp.text[:500]}", status=resp.status_code)
+                if resp.status_code not in RETRYABLE_STATUS:
+                    raise last_err  # auth / bad request: retrying cannot help
+                retry_after = _parse_retry_after(resp.headers.get("Retry-After"))
+
+            if attempt < self.cfg.max_retries:
+                await asyncio.sleep(self._backoff_s(attempt, retry_after))
 
         raise LLMError(f"LLM call failed after retries: {last_err}")
 
 
+@functools.lru_cache(maxsize=1)
 def load_llm_config_from_env() -> LLMConfig:
-    base_url = os.getenv("LLM_BASE_URL", "").strip()
+    """
+    Read once per process; call load_llm_config_from_env.cache_clear() after changing the env.
+    The config is frozen because every caller shares it: use dataclasses.replace() for a variant.
+    """
+    base_url = os.getenv("LLM_BASE_URL", "").strip().rstrip("/")
     api_key = os.getenv("LLM_API_KEY", "").strip()
     model = os.getenv("LLM_MODEL", "gpt-4o-mini").strip()
+    cache_enabled = os.getenv("LLM_CACHE_ENABLED", "").strip().lower() in ("1", "true", "yes")
+    cache_dir = os.getenv("LLM_CACHE_DIR", ".llm_cache").strip() if cache_enabled else None
+    json_mode = os.getenv("LLM_JSON_MODE", "1").strip().lower() not in ("0", "false", "no")
+    stream = os.getenv("LLM_STREAM", "1").strip().lower() not in ("0", "false", "no")
+    compress_requests = os.getenv("LLM_COMPRESS_REQUESTS", "").strip().lower() in ("1", "true", "yes")
 
     if not base_url or not api_key:
         raise ValueError(
             "Missing LLM config. Please set LLM_BASE_URL and LLM_API_KEY in .env or environment."
         )
-    return LLMConfig(base_url=base_url, api_key=api_key, model=model)
+    return LLMConfig(
+        base_url=base_url,
+        api_key=api_key,
+        model=model,
+        cache_dir=cache_dir,
+        json_mode=json_mode,
+        stream=stream,
+        compress_requests=compress_requests,
+    )
 
 
-class BaseAgent:
+class _JSONObjectScanner:
     """
-    Base class for agents: provides system prompt + helper methods for structured outputs.
+    Incremental brace-depth tracker: feed text chunks, learn where the first top-level {...} closes.
+    Anything before the first "{" is skipped; braces inside JSON strings (and escaped quotes) are ignored.
     """
 
-    def __init__(self, name: str, role: str, goal: str, backstory: str, client: OpenAICompatibleClient):
-        self.name = name
-        self.role = role
-        self.goal = goal
-        self.backstory = backstory
-        self.client = client
+    def __init__(self):
+        self.started = False
+        self.depth = 0
+        self.in_string = False
+        self.escape = False
 
-    def system_prompt(self) -> str:
-        return (
-            f"You are {self.name}.\n"
-            f"ROLE: {self.role}\n"
-            f"GOAL: {self.goal}\n"
-            f"CONTEXT: {self.backstory}\n"
-            "Be concise, correct, and produce outputs in the requested format.\n"
-        )
+    def feed(self, chunk: str) -> Optional[int]:
+        """
+        Returns the index in chunk just past the closing brace, or None if the object is still open.
+        """
+        for i, ch in enumerate(chunk):
+            if self.in_string:
+                if self.escape:
+                    self.escape = False
+                elif ch == "\\":
+                    self.escape = True
+                elif ch == '"':
+                    self.in_string = False
+            elif ch == "{":
+                self.started = True
+                self.depth += 1
+            elif not self.started:
+                continue
+            elif ch == '"':
+                self.in_string = True
+            elif ch == "}":
+                self.depth -= 1
+                if self.depth == 0:
+                    return i + 1
+        return None
 
-    def ask(self, user_prompt: str, temperature: float = 0.2) -> str:
-        messages = [
-            {"role": "system", "content": self.system_prompt()},
-            {"role": "user", "content": user_prompt},
-        ]
-        try:
-            return self.client.chat(messages, temperature=temperature)
-        except Exception as e:
-            # 🔴 FALLBACK OFFLINE
-            print(f"[WARN] LLM unavailable ({e}). Using MOCK response.")
-            return self.mock_response(user_prompt)
+
+def _extract_first_json(text: str) -> Optional[str]:
+    """
+    Returns the first balanced top-level {...} in text, or None.
+    """
+    end = _JSONObjectScanner().feed(text)
+    if end is None:
+        return None
+    return text[text.find("{") : end]
 
 
-    def mock_response(self, user_prompt: str) -> str:
-                # === MOCK REQUIREMENTS AGENT ===
-                if "Transform this user story" in user_prompt:
-                    return """
+_PLACEHOLDER = re.compile(r"\{\{(\w+)\}\}")
+
+
+def fill_template(template: str, **values: str) -> str:
+    """
+    Fills {{NAME}} placeholders in a single pass, so substituted text (user story, spec, code)
+    is never searched for further placeholders. Unknown names raise KeyError.
+    """
+    return _PLACEHOLDER.sub(lambda m: values[m[1]], template)
+
+
+def _files_to_dict(entries: Optional[Iterable[Dict[str, Any]]]) -> Dict[str, str]:
+    """
+    [{"path", "content"}, ...] from a model answer -> {path: content}, skipping malformed entries.
+    """
+    return {f["path"].strip(): f["content"] for f in entries or () if "path" in f and "content" in f}
+
+
+def _write_one(item: Tuple[Path, str]) -> None:
+    path, content = item
+    data = content.encode("utf-8")
+    try:
+        if path.stat().st_size == len(data) and path.read_bytes() == data:
+            return  # unchanged since the last run: keep mtime and the page cache intact
+    except FileNotFoundError:
+        pass
+    path.write_bytes(data)
+
+
+# === OFFLINE MOCKS === parsed once at import; used when the LLM is unreachable
+MOCK_SPEC: Dict[str, Any] = {
+    "title": "User Management API",
+    "summary": "CRUD API for managing users",
+    "scope": {
+        "in": ["Create user", "List users", "Update user", "Delete user"],
+        "out": ["Authentication"],
+    },
+    "functional_requirements": [
+        "Create a user",
+        "List users",
+        "Update a user",
+        "Delete a user",
+    ],
+    "non_functional_requirements": [
+        "Readable code",
+        "Fast response",
+    ],
+    "entities": [
         {
-        "title": "User Management API",
-        "summary": "CRUD API for managing users",
-        "scope": {
-            "in": ["Create user", "List users", "Update user", "Delete user"],
-            "out": ["Authentication"]
-        },
-        "functional_requirements": [
-            "Create a user",
-            "List users",
-            "Update a user",
-            "Delete a user"
-        ],
-        "non_functional_requirements": [
-            "Readable code",
-            "Fast response"
-        ],
-        "entities": [
-            {
             "name": "User",
             "fields": [
-                {"name": "id", "type": "int", "required": true},
-                {"name": "name", "type": "str", "required": true},
-                {"name": "email", "type": "str", "required": true}
-            ]
-            }
-        ],
-        "api_endpoints": [
-            {"method": "POST", "path": "/users", "description": "Create user"},
-            {"method": "GET", "path": "/users", "description": "List users"}
-        ],
-        "acceptance_criteria_gherkin": [
-            {
+                {"name": "id", "type": "int", "required": True},
+                {"name": "name", "type": "str", "required": True},
+                {"name": "email", "type": "str", "required": True},
+            ],
+        }
+    ],
+    "api_endpoints": [
+        {"method": "POST", "path": "/users", "description": "Create user"},
+        {"method": "GET", "path": "/users", "description": "List users"},
+    ],
+    "acceptance_criteria_gherkin": [
+        {
             "feature": "Create user",
             "scenario": "User is created",
             "given": ["API running"],
             "when": ["POST /users"],
-            "then": ["User stored"]
-            }
-        ],
-        "tech_choice": {
-            "language": "python",
-            "framework": "fastapi",
-            "test_framework": "pytest"
-        }
+            "then": ["User stored"],
         }
-        """
+    ],
+    "tech_choice": {
+        "language": "python",
+        "framework": "fastapi",
+        "test_framework": "pytest",
+    },
+}
 
-                # === MOCK CODE AGENT ===
-                if "Generate a minimal FastAPI project" in user_prompt:
-                    return """
+MOCK_CODE: Dict[str, Any] = {
+    "files": [
         {
-        "files": [
-            {
             "path": "app/main.py",
-            "content": "from fastapi import FastAPI\\nfrom app.routes import router\\n\\napp = FastAPI()\\napp.include_router(router)"
-            },
-            {
+            "content": "from fastapi import FastAPI\nfrom app.routes import router\n\napp = FastAPI()\napp.include_router(router)",
+        },
+        {
             "path": "app/models.py",
-            "content": "from pydantic import BaseModel\\n\\nclass User(BaseModel):\\n    id: int\\n    name: str\\n    email: str"
-            },
-            {
+            "content": "from pydantic import BaseModel\n\nclass User(BaseModel):\n    id: int\n    name: str\n    email: str",
+        },
+        {
             "path": "app/routes.py",
-            "content": "from fastapi import APIRouter\\nfrom app.models import User\\n\\nrouter = APIRouter()\\nusers = []\\n\\n@router.post('/users')\\ndef create_user(user: User):\\n    users.append(user)\\n    return user\\n\\n@router.get('/users')\\ndef list_users():\\n    return users"
-            },
-            {
+            "content": "from fastapi import APIRouter\nfrom app.models import User\n\nrouter = APIRouter()\nusers = []\n\n@router.post('/users')\ndef create_user(user: User):\n    users.append(user)\n    return user\n\n@router.get('/users')\ndef list_users():\n    return users",
+        },
+        {
             "path": "requirements.txt",
-            "content": "fastapi\\nuvicorn\\npytest"
-            }
-        ]
-        }
-        """
+            "content": "fastapi\nuvicorn\npytest",
+        },
+    ]
+}
 
-                # === MOCK TEST AGENT ===
-                if "Generate pytest tests" in user_prompt:
-                    return """
+MOCK_TESTS: Dict[str, Any] = {
+    "files": [
         {
-        "files": [
-            {
             "path": "tests/test_api.py",
-            "content": "from fastapi.testclient import TestClient\\nfrom app.main import app\\n\\nclient = TestClient(app)\\n\\ndef test_create_user():\\n    r = client.post('/users', json={'id':1,'name':'A','email':'a@test.com'})\\n    assert r.status_code == 200\\n\\ndef test_list_users():\\n    r = client.get('/users')\\n    assert r.status_code == 200"
-            }
-        ]
+            "content": "from fastapi.testclient import TestClient\nfrom app.main import app\n\nclient = TestClient(app)\n\ndef test_create_user():\n    r = client.post('/users', json={'id':1,'name':'A','email':'a@test.com'})\n    assert r.status_code == 200\n\ndef test_list_users():\n    r = client.get('/users')\n    assert r.status_code == 200",
         }
+    ]
+}
+
+# (trigger found in the prompt, canned answer): first match wins
+MOCK_TABLE: Tuple[Tuple[str, Dict[str, Any]], ...] = (
+    ("Transform this user story", MOCK_SPEC),
+    ("Generate a minimal FastAPI project", MOCK_CODE),
+    ("Generate pytest tests", MOCK_TESTS),
+)
+
+
+class BaseAgent:
+    """
+    Base class for agents: provides system prompt + helper methods for structured outputs.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        role: str,
+        goal: str,
+        backstory: str,
+        client: Optional[OpenAICompatibleClient] = None,
+    ):
+        self.name = name
+        self.role = role
+        self.goal = goal
+        self.backstory = backstory
+        self.client = client or OpenAICompatibleClient.instance()
+        # identity is fixed after construction: build the system message once
+        self._system_prompt = (
+            f"You are {name}.\n"
+            f"ROLE: {role}\n"
+            f"GOAL: {goal}\n"
+            f"CONTEXT: {backstory}\n"
+            "Be concise, correct, and produce outputs in the requested format.\n"
+        )
+        self._system_message = {"role": "system", "content": self._system_prompt}
+        # per-agent memo of successful answers, so identical prompts within a run skip the LLM
+        self._mem: Dict[str, str] = {}
+        # bumped on every offline fallback, so callers can tell canned output from real output
+        self.mock_fallbacks = 0
+
+    def system_prompt(self) -> str:
+        return self._system_prompt
+
+    async def ask(
+        self,
+        user_prompt: str,
+        temperature: float = 0.2,
+        response_format: Optional[Dict[str, Any]] = None,
+    ) -> str:
+        try:
+            return await self._ask_llm(user_prompt, temperature, response_format)
+        except Exception as e:
+            # 🔴 FALLBACK OFFLINE
+            print(f"[WARN] LLM unavailable ({e}). Using MOCK response.")
+            self.mock_fallbacks += 1
+            return self.mock_response(user_prompt)
+
+    async def _ask_llm(
+        self,
+        user_prompt: str,
+        temperature: float,
+        response_format: Optional[Dict[str, Any]],
+        validate: Optional[Callable[[str], Any]] = None,
+    ) -> str:
         """
-                return "{}"
+        Memoized LLM call without the offline fallback (mock answers are never memoized).
+        validate is passed to client.chat: an answer it rejects raises ValueError before it is memoized,
+        so retrying after bad output makes a new call instead of replaying it.
+        """
+        key = self._memo_key(user_prompt, temperature, response_format)
+        cached = self._mem.get(key)
+        if cached is not None:
+            try:
+                if validate is not None:
+                    validate(cached)  # the same prompt may have been memoized by ask() unchecked
+                return cached
+            except ValueError:
+                del self._mem[key]
 
+        messages = [self._system_message, {"role": "user", "content": user_prompt}]
+        text = await self.client.chat(
+            messages, temperature=temperature, response_format=response_format, validate=validate
+        )
+        if len(self._mem) >= MEMO_MAX_ENTRIES:
+            del self._mem[next(iter(self._mem))]  # FIFO: dicts keep insertion order
+        self._mem[key] = text
+        return text
+
+    def _memo_key(
+        self,
+        user_prompt: str,
+        temperature: float,
+        response_format: Optional[Dict[str, Any]],
+    ) -> str:
+        h = hashlib.blake2b(digest_size=16)
+        h.update(self._system_prompt.encode("utf-8"))
+        h.update(user_prompt.encode("utf-8"))
+        h.update(f"|{temperature}|".encode("ascii"))
+        if response_format is not None:
+            h.update(orjson.dumps(response_format, option=orjson.OPT_SORT_KEYS))
+        return h.hexdigest()
 
-    def ask_json(self, user_prompt: str, temperature: float = 0.2) -> Dict[str, Any]:
+    def mock_response_obj(self, user_prompt: str) -> Dict[str, Any]:
+        """
+        Canned answer for offline runs: a fresh copy, so callers may modify it (e.g. the spec).
+        """
+        for trigger, value in MOCK_TABLE:
+            if trigger in user_prompt:
+                return copy.deepcopy(value)
+        return {}
+
+    def _mock_json(self, user_prompt: str, err: Exception) -> Dict[str, Any]:
+        # 🔴 FALLBACK OFFLINE: canned object directly, no JSON round-trip
+        print(f"[WARN] LLM unavailable ({err}). Using MOCK response.")
+        self.mock_fallbacks += 1
+        return self.mock_response_obj(user_prompt)
+
+    def mock_response(self, user_prompt: str) -> str:
+        return orjson.dumps(self.mock_response_obj(user_prompt)).decode()
+
+    async def ask_json(
+        self,
+        user_prompt: str,
+        temperature: float = 0.2,
+        schema: Optional[Dict[str, Any]] = None,
+        schema_name: str = "response",
+    ) -> Dict[str, Any]:
         """
         Tries hard to return valid JSON object.
+        With json_mode the schema goes in response_format (json_object without one). It is sent
+        non-strict, so it guides the model rather than being enforced: REQUIREMENTS_SCHEMA keeps
+        free-form example objects that strict mode rejects. Without json_mode, or when the provider
+        answers 400 to response_format, the instruction and the schema are appended to the prompt.
         """
-        strict_prompt = (
-            user_prompt
-            + "\n\nIMPORTANT: Return ONLY a valid JSON object. No markdown. No code fences."
-        )
-        text = self.ask(strict_prompt, temperature=temperature).strip()
+        text: Optional[str] = None
+        if self.client.json_mode:
+            if schema is not None:
+                response_format = {
+                    "type": "json_schema",
+                    "json_schema": {"name": schema_name, "schema": schema},
+                }
+            else:
+                response_format = {"type": "json_object"}
+            try:
+                text = await self._ask_llm(user_prompt, temperature, response_format, self._parse_json)
+            except ValueError:
+                raise  # the model answered, but not with JSON: not an outage, so no mock
+            except LLMError as e:
+                if e.status != 400:
+                    return self._mock_json(user_prompt, e)
+                # probably no response_format support: retry once with the prompt-only path below
+                print(f"[WARN] LLM rejected response_format ({e}). Retrying without it.")
+            except Exception as e:
+                return self._mock_json(user_prompt, e)
+
+        if text is None:
+            strict_prompt = (
+                user_prompt
+                + "\n\nIMPORTANT: Return ONLY a valid JSON object. No markdown. No code fences."
+            )
+            if schema is not None:
+                strict_prompt += "\nJSON schema: " + orjson.dumps(schema).decode()
+            try:
+                text = await self._ask_llm(strict_prompt, temperature, None, self._parse_json)
+            except ValueError:
+                raise
+            except Exception as e:
+                return self._mock_json(user_prompt, e)
+            if self.client.json_mode:
+                self.client.json_mode = False  # plain path works where response_format did not
+        return self._parse_json(text)
+
+    def _parse_json(self, text: str) -> Dict[str, Any]:
+        """
+        The answer as a JSON object; raises ValueError (which orjson.JSONDecodeError subclasses) otherwise.
+        """
+        text = text.strip()
 
         # Try direct parse
         try:
-            return json.loads(text)
-        except Exception:
-            # Fallback: attempt to extract first {...}
-            start = text.find("{")
-            end = text.rfind("}")
-            if start != -1 and end != -1 and end > start:
-                snippet = text[start : end + 1]
-                return json.loads(snippet)
+            return orjson.loads(text)
+        except orjson.JSONDecodeError:
+            # Fallback: first balanced {...} (model wrapped the JSON in prose or fences)
+            snippet = _extract_first_json(text)
+            if snippet is not None:
+                return orjson.loads(snippet)
 
         raise ValueError(f"{self.name} returned non-JSON output: {text[:400]}")
+
+    @staticmethod
+    def _write_files(files: Dict[str, str], root_dir: str) -> List[str]:
+        """
+        Writes {rel_path: content} under root_dir in parallel; returns rel paths in input order.
+        """
+        root = Path(root_dir)
+        items = [(root / rel_path, content) for rel_path, content in files.items()]
+        for d in {path.parent for path, _ in items}:
+            d.mkdir(parents=True, exist_ok=True)
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            list(pool.map(_write_one, items))  # list() re-raises the first write error
+        return list(files)
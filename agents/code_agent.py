@@ -1,27 +1,16 @@
 from __future__ import annotations
 
-import json
-import os
-from typing import Any, Dict, List, Tuple
+import asyncio
+from typing import Dict, List, Sequence, Tuple
 
-from agents.base_agent import BaseAgent
+from agents.base_agent import FILE_SCHEMA, FILES_SCHEMA, BaseAgent, _files_to_dict, fill_template
 
 
-class CodeAgent(BaseAgent):
-    """
-    Input: spec JSON
-    Output: dict of generated files {path: content}
-    Saves files to disk.
-    """
-
-    def generate_code_files(self, spec: Dict[str, Any]) -> Dict[str, str]:
-        spec_pretty = json.dumps(spec, indent=2, ensure_ascii=False)
-
-        prompt = f"""
+CODE_PROMPT_TEMPLATE = """
 You are generating a small but clean codebase for the given spec.
 
 SPEC JSON:
-{spec_pretty}
+{{SPEC}}
 
 Generate a minimal FastAPI project with:
 - app/main.py (FastAPI app)
@@ -36,25 +25,73 @@ Constraints:
 - Use Pydantic models.
 - Provide CRUD for main entity.
 - Code must be complete, no placeholders like TODO.
-- Return JSON object: {{ "files": [{{"path":"...","content":"..."}}, ...] }}
-- No markdown. Only JSON.
+- Answer with the files as JSON.
 """
-        data = self.ask_json(prompt, temperature=0.2)
 
-        files = data.get("files", [])
-        out: Dict[str, str] = {}
-        for f in files:
-            path = f["path"].strip()
-            content = f["content"]
-            out[path] = content
-        return out
+FILE_PROMPT_TEMPLATE = """
+You are writing ONE file of a small but clean codebase for the given spec.
+
+SPEC JSON:
+{{SPEC}}
+
+PROJECT FILES (path: intent):
+{{FILE_PLAN}}
+
+Write only this file: {{PATH}} ({{INTENT}})
+
+Constraints:
+- Keep it simple and runnable; imports must match the project files above.
+- Use Pydantic models.
+- Code must be complete, no placeholders like TODO.
+- Answer with this file as JSON.
+"""
+
+
+class CodeAgent(BaseAgent):
+    """
+    Input: spec JSON (already serialized by the orchestrator)
+    Output: dict of generated files {path: content}
+    Saves files to disk.
+    """
+
+    async def generate_code_files(
+        self, spec_pretty: str, file_plan: Sequence[Dict[str, str]] = ()
+    ) -> Dict[str, str]:
+        """
+        With a file_plan (from the spec), each file is its own LLM call and the calls run concurrently
+        (bounded by the client's max_concurrency). Without one, or if any planned file comes back empty
+        or not as JSON, the whole project comes from one call.
+        """
+        plan = [(f["path"].strip(), f.get("intent", "")) for f in file_plan if f.get("path")]
+        if plan:
+            per_file = await self._generate_per_file(spec_pretty, plan)
+            if per_file:
+                return per_file
+
+        prompt = fill_template(CODE_PROMPT_TEMPLATE, SPEC=spec_pretty)
+        data = await self.ask_json(prompt, temperature=0.2, schema=FILES_SCHEMA, schema_name="files")
+
+        return _files_to_dict(data.get("files"))
+
+    async def _generate_per_file(self, spec_pretty: str, plan: List[Tuple[str, str]]) -> Dict[str, str]:
+        plan_text = "\n".join(f"- {path}: {intent}" for path, intent in plan)
+
+        async def gen_one(path: str, intent: str) -> Tuple[str, str]:
+            prompt = fill_template(
+                FILE_PROMPT_TEMPLATE, SPEC=spec_pretty, FILE_PLAN=plan_text, PATH=path, INTENT=intent
+            )
+            try:
+                data = await self.ask_json(prompt, temperature=0.2, schema=FILE_SCHEMA, schema_name="file")
+            except ValueError as e:  # non-JSON answer: counts as missing, like an empty one
+                print(f"[WARN] {self.name} could not generate {path} ({e}).")
+                return path, ""
+            return path, data.get("content", "")
+
+        results = await asyncio.gather(*(gen_one(path, intent) for path, intent in plan))
+        if not all(content for _, content in results):
+            # a project missing some planned files (e.g. routes imported by main) is worse than none
+            return {}
+        return dict(results)
 
     def save_files(self, files: Dict[str, str], root_dir: str) -> List[str]:
-        written: List[str] = []
-        for rel_path, content in files.items():
-            abs_path = os.path.join(root_dir, rel_path)
-            os.makedirs(os.path.dirname(abs_path), exist_ok=True)
-            with open(abs_path, "w", encoding="utf-8") as fp:
-                fp.write(content)
-            written.append(rel_path)
-        return written
+        return self._write_files(files, root_dir)
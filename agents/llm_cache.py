@@ -0,0 +1,46 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+from typing import Any, Optional
+
+
+def cache_key(payload: Any) -> str:
+    """
+    SHA-256 of the canonical JSON form of payload (sorted keys, so dict order does not matter).
+    """
+    raw = json.dumps(payload, sort_keys=True, ensure_ascii=False).encode("utf-8")
+    return hashlib.sha256(raw).hexdigest()
+
+
+class DiskCache:
+    """
+    Tiny persistent key -> JSON value store: one file per key under root_dir.
+    Writes go through a temp file + os.replace so a crash never leaves a half-written entry.
+    """
+
+    def __init__(self, root_dir: str):
+        self.root_dir = root_dir
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root_dir, f"{key}.json")
+
+    def get(self, key: str) -> Optional[Any]:
+        try:
+            with open(self._path(key), "r", encoding="utf-8") as fp:
+                return json.load(fp)["value"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def set(self, key: str, value: Any) -> None:
+        # best effort: a read-only or full disk must not fail the call being cached
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.root_dir, exist_ok=True)
+            with open(tmp, "w", encoding="utf-8") as fp:
+                json.dump({"value": value}, fp, ensure_ascii=False)
+            os.replace(tmp, path)
+        except OSError:
+            pass
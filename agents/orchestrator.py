@@ -1,8 +1,48 @@
 from __future__ import annotations
 
+import asyncio
 import os
 from typing import Any, Dict, Optional
 
+import orjson
+
+from agents.base_agent import FILES_SCHEMA, _files_to_dict, fill_template
+from agents.code_agent import CODE_PROMPT_TEMPLATE, FILE_PROMPT_TEMPLATE
+from agents.llm_cache import DiskCache, cache_key
+from agents.requirements_agent import REQUIREMENTS_SCHEMA
+from agents.test_agent import TEST_PROMPT_TEMPLATE
+
+# part of the code/test cache key: editing a prompt invalidates what it produced
+PROMPTS_VERSION = cache_key([CODE_PROMPT_TEMPLATE, FILE_PROMPT_TEMPLATE, TEST_PROMPT_TEMPLATE])[:16]
+
+
+BATCH_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "spec": REQUIREMENTS_SCHEMA,
+        "code_files": FILES_SCHEMA["properties"]["files"],
+        "test_files": FILES_SCHEMA["properties"]["files"],
+    },
+    "required": ["spec", "code_files", "test_files"],
+}
+
+BATCH_PROMPT_TEMPLATE = """
+Turn this user story into a specification, a minimal FastAPI project implementing it,
+and pytest tests for that project, all in one answer.
+
+USER STORY:
+{{USER_STORY}}
+
+Answer with JSON holding the spec, the code files and the test files.
+
+Rules:
+- spec: implementable in a small demo, at least 3 endpoints (CRUD); file_plan may be left empty.
+- code_files: app/main.py, app/models.py (Pydantic), app/storage.py (in-memory or SQLite),
+  app/routes.py, requirements.txt, README_generated.md. Complete code, no TODO placeholders.
+- test_files: fastapi.testclient.TestClient tests for create, read list, read by id, update, delete,
+  plus at least 2 edge cases (invalid payload, missing id, etc.).
+"""
+
 
 class Orchestrator:
     """
@@ -14,24 +54,99 @@ class Orchestrator:
     - Saves everything to disk
     """
 
-    def __init__(self, requirements_agent, code_agent, test_agent, project_root: str):
+    def __init__(
+        self,
+        requirements_agent,
+        code_agent,
+        test_agent,
+        project_root: str,
+        cache_dir: Optional[str] = None,
+    ):
         self.requirements_agent = requirements_agent
         self.code_agent = code_agent
         self.test_agent = test_agent
         self.project_root = project_root
+        # (spec, models, prompts) hash -> {code_files, test_files}: an unchanged spec skips the code and test LLM calls
+        self._cache = DiskCache(cache_dir) if cache_dir else None
 
-    def run(self, user_story: str) -> Dict[str, Any]:
+    async def run(self, user_story: str) -> Dict[str, Any]:
         # 1) Requirements
-        spec = self.requirements_agent.generate_spec(user_story)
+        spec = await self.requirements_agent.generate_spec(user_story)
+        return await self._run_from_spec(spec)
+
+    async def _run_from_spec(self, spec: Dict[str, Any]) -> Dict[str, Any]:
+        spec_hash = self._cache_key(spec) if self._cache else None
+        if spec_hash:
+            cached = self._cache.get(spec_hash)
+            if cached is not None:
+                return await self._save_all(spec, cached["code_files"], cached["test_files"])
+
+        mocks_before = self.code_agent.mock_fallbacks + self.test_agent.mock_fallbacks
+        # serialized once for both prompts; compact: the model does not need indentation
+        spec_pretty = orjson.dumps(spec).decode()
 
         # 2) Code
-        code_files = self.code_agent.generate_code_files(spec)
-        code_written = self.code_agent.save_files(code_files, self.project_root)
+        code_files = await self.code_agent.generate_code_files(spec_pretty, spec.get("file_plan") or ())
+
+        # 3) Tests (code files are written while the test agent waits on the LLM)
+        code_written, test_files = await asyncio.gather(
+            asyncio.to_thread(self.code_agent.save_files, code_files, self.project_root),
+            self.test_agent.generate_tests(spec_pretty, code_files),
+        )
+        tests_written = await asyncio.to_thread(self.test_agent.save_files, test_files, self.project_root)
+
+        # never cache canned offline output under a real spec: later runs would replay it
+        real_output = self.code_agent.mock_fallbacks + self.test_agent.mock_fallbacks == mocks_before
+        if spec_hash and code_files and test_files and real_output:
+            self._cache.set(spec_hash, {"code_files": code_files, "test_files": test_files})
+
+        return {
+            "spec": spec,
+            "code_written": code_written,
+            "tests_written": tests_written,
+        }
+
+    def _cache_key(self, spec: Dict[str, Any]) -> str:
+        return cache_key(
+            {
+                "spec": spec,
+                "code_model": self.code_agent.client.cfg.model,
+                "test_model": self.test_agent.client.cfg.model,
+                "prompts": PROMPTS_VERSION,
+            }
+        )
+
+    async def run_batched(self, user_story: str) -> Dict[str, Any]:
+        """
+        Same result as run(), but spec + code + tests come from a single LLM call.
+        Falls back to the per-agent calls when the combined answer is not JSON (e.g. truncated at the
+        output limit) or incomplete. A complete answer is used whatever the spec size: it fit.
+        """
+        prompt = fill_template(BATCH_PROMPT_TEMPLATE, USER_STORY=user_story)
+        try:
+            data = await self.code_agent.ask_json(prompt, temperature=0.2, schema=BATCH_SCHEMA, schema_name="project")
+        except ValueError as e:  # typically cut off at the output limit: no balanced JSON object
+            print(f"[WARN] Batched answer unusable ({e}). Using the per-agent calls.")
+            return await self.run(user_story)
+
+        spec = data.get("spec")
+        if not isinstance(spec, dict) or not spec:
+            return await self.run(user_story)
+
+        code_files = _files_to_dict(data.get("code_files"))
+        test_files = _files_to_dict(data.get("test_files"))
+        if not code_files or not test_files:
+            return await self._run_from_spec(spec)
 
-        # 3) Tests
-        test_files = self.test_agent.generate_tests(spec, code_files)
-        tests_written = self.test_agent.save_files(test_files, self.project_root)
+        return await self._save_all(spec, code_files, test_files)
 
+    async def _save_all(
+        self, spec: Dict[str, Any], code_files: Dict[str, str], test_files: Dict[str, str]
+    ) -> Dict[str, Any]:
+        code_written, tests_written = await asyncio.gather(
+            asyncio.to_thread(self.code_agent.save_files, code_files, self.project_root),
+            asyncio.to_thread(self.test_agent.save_files, test_files, self.project_root),
+        )
         return {
             "spec": spec,
             "code_written": code_written,
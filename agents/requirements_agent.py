@@ -2,66 +2,130 @@ from __future__ import annotations
 
 from typing import Any, Dict
 
-from agents.base_agent import BaseAgent
+from agents.base_agent import BaseAgent, fill_template
 
+_STR_LIST: Dict[str, Any] = {"type": "array", "items": {"type": "string"}}
 
-class RequirementsAgent(BaseAgent):
-    """
-    Input: vague user story
-    Output: structured spec JSON + acceptance criteria (Gherkin)
-    """
+# sent as a non-strict response_format json_schema (or appended to the prompt without JSON mode);
+# it guides the model, nothing enforces it: the *_example objects are free-form, which strict mode rejects
+REQUIREMENTS_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string", "description": "short title"},
+        "summary": {"type": "string", "description": "1-3 sentences"},
+        "scope": {
+            "type": "object",
+            "properties": {"in": _STR_LIST, "out": _STR_LIST},
+            "required": ["in", "out"],
+        },
+        "functional_requirements": _STR_LIST,
+        "non_functional_requirements": _STR_LIST,
+        "entities": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string", "description": "EntityName"},
+                    "fields": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "name": {"type": "string"},
+                                "type": {"type": "string", "description": "str/int/..."},
+                                "required": {"type": "boolean"},
+                            },
+                            "required": ["name", "type", "required"],
+                        },
+                    },
+                },
+                "required": ["name", "fields"],
+            },
+        },
+        "api_endpoints": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "method": {"type": "string", "enum": ["GET", "POST", "PUT", "DELETE"]},
+                    "path": {"type": "string", "description": "/..."},
+                    "description": {"type": "string"},
+                    "request_body_example": {"type": "object"},
+                    "response_example": {"type": "object"},
+                },
+                "required": ["method", "path", "description"],
+            },
+        },
+        "acceptance_criteria_gherkin": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "feature": {"type": "string"},
+                    "scenario": {"type": "string"},
+                    "given": _STR_LIST,
+                    "when": _STR_LIST,
+                    "then": _STR_LIST,
+                },
+                "required": ["feature", "scenario", "given", "when", "then"],
+            },
+        },
+        "tech_choice": {
+            "type": "object",
+            "properties": {
+                "language": {"type": "string", "enum": ["python"]},
+                "framework": {"type": "string", "enum": ["fastapi"]},
+                "test_framework": {"type": "string", "enum": ["pytest"]},
+            },
+            "required": ["language", "framework", "test_framework"],
+        },
+        "file_plan": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "path": {"type": "string"},
+                    "intent": {"type": "string", "description": "one line: what this file contains"},
+                },
+                "required": ["path", "intent"],
+            },
+        },
+    },
+    "required": [
+        "title",
+        "summary",
+        "scope",
+        "functional_requirements",
+        "non_functional_requirements",
+        "entities",
+        "api_endpoints",
+        "acceptance_criteria_gherkin",
+        "tech_choice",
+        "file_plan",
+    ],
+}
 
-    def generate_spec(self, user_story: str) -> Dict[str, Any]:
-        prompt = f"""
-Transform this user story into a clear, structured software specification.
+SPEC_PROMPT_TEMPLATE = """
+Transform this user story into a clear, structured software specification (JSON).
 
 USER STORY:
-{user_story}
-
-Return JSON with this schema:
-{{
-  "title": "short title",
-  "summary": "1-3 sentences",
-  "scope": {{
-    "in": ["..."],
-    "out": ["..."]
-  }},
-  "functional_requirements": ["..."],
-  "non_functional_requirements": ["..."],
-  "entities": [
-    {{
-      "name": "EntityName",
-      "fields": [{{"name":"id","type":"str/int","required":true}}, ...]
-    }}
-  ],
-  "api_endpoints": [
-    {{
-      "method":"GET/POST/PUT/DELETE",
-      "path":"/...",
-      "description":"...",
-      "request_body_example": {{}},
-      "response_example": {{}}
-    }}
-  ],
-  "acceptance_criteria_gherkin": [
-    {{
-      "feature":"...",
-      "scenario":"...",
-      "given":["..."],
-      "when":["..."],
-      "then":["..."]
-    }}
-  ],
-  "tech_choice": {{
-    "language":"python",
-    "framework":"fastapi",
-    "test_framework":"pytest"
-  }}
-}}
+{{USER_STORY}}
 
 Rules:
 - Keep it implementable in a small demo.
 - Prefer FastAPI CRUD in-memory or SQLite (simple).
 - Provide at least 3 endpoints (CRUD).
+- file_plan lists every file of the FastAPI project: app/main.py, app/models.py,
+  app/storage.py, app/routes.py, requirements.txt, README_generated.md.
 """
-        return self.ask_json(prompt, temperature=0.2)
+
+
+class RequirementsAgent(BaseAgent):
+    """
+    Input: vague user story
+    Output: structured spec JSON + acceptance criteria (Gherkin)
+    """
+
+    async def generate_spec(self, user_story: str) -> Dict[str, Any]:
+        prompt = fill_template(SPEC_PROMPT_TEMPLATE, USER_STORY=user_story)
+        return await self.ask_json(prompt, temperature=0.2, schema=REQUIREMENTS_SCHEMA, schema_name="spec")
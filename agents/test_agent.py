@@ -1,54 +1,45 @@
 from __future__ import annotations
 
-import json
-import os
-from typing import Any, Dict, List
+from typing import Dict, List
 
-from agents.base_agent import BaseAgent
+import orjson
 
+from agents.base_agent import FILES_SCHEMA, BaseAgent, _files_to_dict, fill_template
 
-class TestAgent(BaseAgent):
-    """
-    Input: spec + generated code files
-    Output: pytest tests (API tests using TestClient)
-    """
+KEY_PATHS = ("app/main.py", "app/routes.py", "app/models.py")
 
-    def generate_tests(self, spec: Dict[str, Any], generated_files: Dict[str, str]) -> Dict[str, str]:
-        spec_pretty = json.dumps(spec, indent=2, ensure_ascii=False)
-
-        # keep only key files to avoid huge prompt
-        key_files = {k: v for k, v in generated_files.items() if k in ["app/main.py", "app/routes.py", "app/models.py"]}
-        key_pretty = json.dumps(key_files, indent=2, ensure_ascii=False)
-
-        prompt = f"""
+TEST_PROMPT_TEMPLATE = """
 Generate pytest tests for a FastAPI app following this spec.
 
 SPEC:
-{spec_pretty}
+{{SPEC}}
 
 KEY CODE FILES (for context):
-{key_pretty}
+{{KEY_FILES}}
 
 Requirements:
 - Use fastapi.testclient.TestClient
 - Create tests for: create, read list, read by id, update, delete
 - Include at least 2 edge cases (invalid payload, missing id, etc.)
-- Return JSON object: {{ "files": [{{"path":"tests/test_api.py","content":"..."}}, ...] }}
-- No markdown. Only JSON.
+- Put the tests under tests/ (e.g. tests/test_api.py)
+- Answer with the files as JSON.
 """
-        data = self.ask_json(prompt, temperature=0.2)
-        files = data.get("files", [])
-        out: Dict[str, str] = {}
-        for f in files:
-            out[f["path"].strip()] = f["content"]
-        return out
+
+
+class TestAgent(BaseAgent):
+    """
+    Input: spec (already serialized) + generated code files
+    Output: pytest tests (API tests using TestClient)
+    """
+
+    async def generate_tests(self, spec_pretty: str, generated_files: Dict[str, str]) -> Dict[str, str]:
+        # keep only key files to avoid huge prompt
+        key_files = {k: generated_files[k] for k in KEY_PATHS if k in generated_files}
+        key_pretty = orjson.dumps(key_files).decode()
+
+        prompt = fill_template(TEST_PROMPT_TEMPLATE, SPEC=spec_pretty, KEY_FILES=key_pretty)
+        data = await self.ask_json(prompt, temperature=0.2, schema=FILES_SCHEMA, schema_name="files")
+        return _files_to_dict(data.get("files"))
 
     def save_files(self, files: Dict[str, str], root_dir: str) -> List[str]:
-        written: List[str] = []
-        for rel_path, content in files.items():
-            abs_path = os.path.join(root_dir, rel_path)
-            os.makedirs(os.path.dirname(abs_path), exist_ok=True)
-            with open(abs_path, "w", encoding="utf-8") as fp:
-                fp.write(content)
-            written.append(rel_path)
-        return written
+        return self._write_files(files, root_dir)
@@ -1,7 +1,9 @@
+import argparse
+import asyncio
 import os
 from dotenv import load_dotenv
 
-from agents.base_agent import OpenAICompatibleClient, load_llm_config_from_env
+from agents.base_agent import OpenAICompatibleClient
 from agents.base_agent import BaseAgent
 from agents.requirements_agent import RequirementsAgent
 from agents.code_agent import CodeAgent
@@ -10,8 +12,7 @@ from agents.orchestrator import Orchestrator
 
 
 def build_agents():
-    cfg = load_llm_config_from_env()
-    client = OpenAICompatibleClient(cfg)
+    client = OpenAICompatibleClient.instance()
 
     req = RequirementsAgent(
         name="RequirementsAgent",
@@ -40,7 +41,30 @@ def build_agents():
     return req, code, tests
 
 
+async def run_pipeline(orchestrator: Orchestrator, user_story: str, batched: bool = False):
+    try:
+        if batched:
+            return await orchestrator.run_batched(user_story)
+        return await orchestrator.run(user_story)
+    finally:
+        # all agents share one client; release its connection pool inside the loop
+        await orchestrator.code_agent.client.aclose()
+
+
 def main():
+    parser = argparse.ArgumentParser(description="Generate a FastAPI project and its tests from a user story.")
+    parser.add_argument(
+        "--no-cache",
+        action="store_true",
+        help="always regenerate code and tests, even when the spec matches a previous run",
+    )
+    parser.add_argument(
+        "--batched",
+        action="store_true",
+        help="ask for spec, code and tests in one LLM call (falls back to three calls if the answer is unusable)",
+    )
+    args = parser.parse_args()
+
     load_dotenv()
 
     project_root = os.path.dirname(os.path.abspath(__file__))
@@ -53,9 +77,15 @@ Chaque utilisateur a: id, name, email.
 """
 
     req, code, tests = build_agents()
-    orchestrator = Orchestrator(req, code, tests, project_root=project_root)
+    orchestrator = Orchestrator(
+        req,
+        code,
+        tests,
+        project_root=project_root,
+        cache_dir=None if args.no_cache else os.path.join(project_root, ".orch_cache"),
+    )
 
-    result = orchestrator.run(user_story)
+    result = asyncio.run(run_pipeline(orchestrator, user_story, batched=args.batched))
 
     print("\n✅ DONE")
     print("Files created:")
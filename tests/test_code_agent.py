@@ -0,0 +1,75 @@
+import asyncio
+import json
+
+import httpx
+
+from agents.base_agent import LLMConfig, OpenAICompatibleClient
+from agents.code_agent import CodeAgent
+
+PLAN = [
+    {"path": "app/main.py", "intent": "FastAPI app"},
+    {"path": "app/routes.py", "intent": "API routes"},
+]
+
+
+def completion(text):
+    return httpx.Response(200, json={"choices": [{"message": {"content": text}}]})
+
+def run_agent(answer_for):
+    """answer_for(prompt) -> answer text; returns (generated files, prompts seen by the LLM)."""
+    prompts = []
+
+    def handler(request):
+        prompt = json.loads(request.content)["messages"][-1]["content"]
+        prompts.append(prompt)
+        return completion(answer_for(prompt))
+
+    cfg = LLMConfig(base_url="http://llm.test/v1", api_key="k", max_retries=0, stream=False)
+    client = OpenAICompatibleClient(cfg, transport=httpx.MockTransport(handler))
+    agent = CodeAgent(name="CodeAgent", role="r", goal="g", backstory="b", client=client)
+
+    async def go():
+        try:
+            return await agent.generate_code_files("{}", PLAN)
+        finally:
+            await client.aclose()
+    return asyncio.run(go()), prompts
+
+def is_single_call(prompt):
+    return "Generate a minimal FastAPI project" in prompt
+
+SINGLE_CALL_ANSWER = json.dumps({"files": [{"path": "app/main.py", "content": "single"}]})
+
+
+def test_one_call_per_planned_file():
+    def answer_for(prompt):
+        path = "app/routes.py" if "Write only this file: app/routes.py" in prompt else "app/main.py"
+        return json.dumps({"path": path, "content": f"# {path}"})
+
+    files, prompts = run_agent(answer_for)
+    assert files == {"app/main.py": "# app/main.py", "app/routes.py": "# app/routes.py"}
+    assert len(prompts) == 2
+    assert not any(is_single_call(p) for p in prompts)
+
+def test_empty_planned_file_falls_back_to_single_call():
+    def answer_for(prompt):
+        if is_single_call(prompt):
+            return SINGLE_CALL_ANSWER
+        content = "" if "Write only this file: app/routes.py" in prompt else "x"
+        return json.dumps({"path": "p", "content": content})
+
+    files, prompts = run_agent(answer_for)
+    assert files == {"app/main.py": "single"}
+    assert sum(is_single_call(p) for p in prompts) == 1
+
+def test_non_json_planned_file_falls_back_to_single_call():
+    def answer_for(prompt):
+        if is_single_call(prompt):
+            return SINGLE_CALL_ANSWER
+        if "Write only this file: app/routes.py" in prompt:
+            return "Sorry, I cannot do that."
+        return json.dumps({"path": "app/main.py", "content": "x"})
+
+    files, prompts = run_agent(answer_for)
+    assert files == {"app/main.py": "single"}
+    assert sum(is_single_call(p) for p in prompts) == 1
@@ -0,0 +1,28 @@
+from agents.base_agent import _extract_first_json, _JSONObjectScanner
+
+
+def test_extract_plain_object():
+    assert _extract_first_json('{"a": 1}') == '{"a": 1}'
+
+def test_extract_skips_prose_and_trailing_objects():
+    text = 'Sure, here it is: {"a": {"b": 2}} and also {"c": 3}'
+    assert _extract_first_json(text) == '{"a": {"b": 2}}'
+
+def test_extract_ignores_braces_and_escaped_quotes_in_strings():
+    text = 'x {"code": "def f():\\n    return \\"}{\\"", "n": 1} tail'
+    assert _extract_first_json(text) == '{"code": "def f():\\n    return \\"}{\\"", "n": 1}'
+
+def test_extract_ignores_quotes_before_the_object():
+    assert _extract_first_json('He said "hi" {"a": "}"}') == '{"a": "}"}'
+
+def test_extract_escaped_backslash_before_closing_quote():
+    assert _extract_first_json('{"p": "C:\\\\"} rest') == '{"p": "C:\\\\"}'
+
+def test_extract_returns_none_without_balanced_object():
+    assert _extract_first_json("no json here") is None
+    assert _extract_first_json('{"a": 1') is None
+
+def test_scanner_across_chunks():
+    scanner = _JSONObjectScanner()
+    chunks = ['pre {"a', '": "x\\', '"}"', ', "b": {}', '} after']
+    assert [scanner.feed(c) for c in chunks] == [None, None, None, None, 1]
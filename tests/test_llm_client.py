@@ -0,0 +1,260 @@
+import asyncio
+import gzip
+import json
+import warnings
+
+import httpx
+import pytest
+
+from agents.base_agent import MOCK_SPEC, BaseAgent, LLMConfig, LLMError, OpenAICompatibleClient, _parse_retry_after
+from agents.llm_cache import cache_key
+
+MESSAGES = [{"role": "user", "content": "hi"}]
+
+
+def make_client(handler, **overrides):
+    cfg = dict(
+        base_url="http://llm.test/v1/",
+        api_key="k",
+        max_retries=2,
+        backoff_base_s=0.0,
+        backoff_max_s=0.0,  # no real sleeping between attempts
+        stream=False,
+    )
+    cfg.update(overrides)
+    return OpenAICompatibleClient(LLMConfig(**cfg), transport=httpx.MockTransport(handler))
+
+def completion(text):
+    return httpx.Response(200, json={"choices": [{"message": {"content": text}}]})
+
+def chat(client, **kwargs):
+    async def go():
+        try:
+            return await client.chat(MESSAGES, **kwargs)
+        finally:
+            await client.aclose()
+    return asyncio.run(go())
+
+
+def test_parse_retry_after():
+    assert _parse_retry_after(None) is None
+    assert _parse_retry_after("3") == 3.0
+    assert _parse_retry_after("-1") == 0.0
+    assert _parse_retry_after("Wed, 21 Oct 2015 07:28:00 GMT") == 0.0  # in the past
+    assert _parse_retry_after("soon") is None
+
+def test_backoff_honors_retry_after_up_to_max():
+    client = make_client(completion, backoff_base_s=0.5, backoff_max_s=30.0)
+    assert client._backoff_s(0, retry_after=2.0) == 2.0
+    assert client._backoff_s(0, retry_after=120.0) == 30.0
+    assert 0.5 <= client._backoff_s(0) <= 1.5
+    assert client._backoff_s(10) == 30.0
+
+def test_success_sends_auth_and_payload():
+    seen = []
+
+    def handler(request):
+        seen.append(request)
+        return completion("hello")
+
+    assert chat(make_client(handler), temperature=0.0) == "hello"
+    assert str(seen[0].url) == "http://llm.test/v1/chat/completions"
+    assert seen[0].headers["Authorization"] == "Bearer k"
+    assert json.loads(seen[0].content)["temperature"] == 0.0
+
+@pytest.mark.parametrize("status", [429, 500, 502, 503, 504])
+def test_retryable_status_is_retried(status):
+    calls = []
+
+    def handler(request):
+        calls.append(1)
+        return httpx.Response(status) if len(calls) == 1 else completion("ok")
+
+    assert chat(make_client(handler)) == "ok"
+    assert len(calls) == 2
+
+@pytest.mark.parametrize("status", [400, 401, 403, 404])
+def test_non_retryable_status_raises_immediately(status):
+    calls = []
+
+    def handler(request):
+        calls.append(1)
+        return httpx.Response(status, text="nope")
+
+    with pytest.raises(LLMError) as err:
+        chat(make_client(handler))
+    assert err.value.status == status
+    assert len(calls) == 1
+
+def test_transport_error_is_retried_until_exhausted():
+    calls = []
+
+    def handler(request):
+        calls.append(1)
+        raise httpx.ConnectError("down", request=request)
+
+    with pytest.raises(LLMError):
+        chat(make_client(handler, max_retries=2))
+    assert len(calls) == 3
+
+def test_gzip_dropped_after_415():
+    encodings = []
+
+    def handler(request):
+        encodings.append(request.headers.get("Content-Encoding"))
+        if request.headers.get("Content-Encoding") == "gzip":
+            gzip.decompress(request.content)  # body really is gzip
+            return httpx.Response(415)
+        return completion("plain")
+
+    client = make_client(handler, compress_requests=True, max_retries=0)
+    long_messages = [{"role": "user", "content": "x" * 4096}]
+
+    async def go():
+        first = await client.chat(long_messages)
+        second = await client.chat(long_messages)
+        await client.aclose()
+        return first, second
+
+    assert asyncio.run(go()) == ("plain", "plain")
+    assert encodings == ["gzip", None, None]
+
+def test_stream_reads_all_deltas():
+    events = [
+        {"choices": [{"delta": {"content": '{"a": '}}]},
+        {"choices": [{"delta": {"content": '1} trailing'}}]},
+        {"choices": [{"delta": {"content": " prose"}}]},
+    ]
+    body = "".join(f"data: {json.dumps(e)}\n\n" for e in events) + "data: [DONE]\n\n"
+
+    def handler(request):
+        assert json.loads(request.content)["stream"] is True
+        return httpx.Response(200, text=body, headers={"Content-Type": "text/event-stream"})
+
+    assert chat(make_client(handler, stream=True)) == '{"a": 1} trailing prose'
+
+def test_ask_json_retries_without_response_format_on_400():
+    formats = []
+
+    def handler(request):
+        payload = json.loads(request.content)
+        formats.append(payload.get("response_format"))
+        if "response_format" in payload:
+            return httpx.Response(400, text="response_format not supported")
+        return completion('{"ok": true}')
+
+    client = make_client(handler)
+    agent = BaseAgent(name="A", role="r", goal="g", backstory="b", client=client)
+
+    async def go():
+        first = await agent.ask_json("Return JSON please")
+        second = await agent.ask_json("Return other JSON please")
+        await client.aclose()
+        return first, second
+
+    assert asyncio.run(go()) == ({"ok": True}, {"ok": True})
+    assert formats[0] == {"type": "json_object"}
+    assert formats[1:] == [None, None]  # the client remembers the provider has no JSON mode
+    assert agent.mock_fallbacks == 0
+
+def test_disk_cache_stores_only_validated_answers(tmp_path):
+    answers = ["Sorry, I cannot do that.", '{"ok": true}']
+    calls = []
+
+    def handler(request):
+        calls.append(1)
+        return completion(answers[min(len(calls), len(answers)) - 1])
+
+    def run_once():
+        # a fresh client and agent per run, sharing only the disk cache
+        client = make_client(handler, cache_dir=str(tmp_path))
+        agent = BaseAgent(name="A", role="r", goal="g", backstory="b", client=client)
+
+        async def go():
+            try:
+                return await agent.ask_json("Return JSON please")
+            finally:
+                await client.aclose()
+        return asyncio.run(go())
+
+    with pytest.raises(ValueError):
+        run_once()
+    # the provider recovered: the prose answer was not cached, so the next run asks again
+    assert run_once() == {"ok": True}
+    assert run_once() == {"ok": True}
+    assert len(calls) == 2
+
+def test_cached_answer_failing_validation_is_fetched_again(tmp_path):
+    calls = []
+
+    def handler(request):
+        calls.append(1)
+        return completion('{"fresh": 1}')
+
+    client = make_client(handler, cache_dir=str(tmp_path))
+    payload = {"model": client.cfg.model, "messages": MESSAGES, "temperature": 0.2}
+    client._cache.set(cache_key(payload), "garbage")  # e.g. written by an older version
+
+    assert chat(client, validate=json.loads) == '{"fresh": 1}'
+    assert chat(client, validate=json.loads) == '{"fresh": 1}'  # the good answer replaced the bad one
+    assert len(calls) == 1
+
+def test_empty_answer_is_not_cached(tmp_path):
+    calls = []
+
+    def handler(request):
+        calls.append(1)
+        return completion("")
+
+    client = make_client(handler, cache_dir=str(tmp_path))
+    assert chat(client) == ""
+    assert chat(client) == ""
+    assert len(calls) == 2
+
+def test_memo_keeps_only_validated_answers():
+    answers = ["Sorry, I cannot do that.", '{"ok": true}']
+    calls = []
+
+    def handler(request):
+        calls.append(1)
+        return completion(answers[min(len(calls), len(answers)) - 1])
+
+    client = make_client(handler)
+    agent = BaseAgent(name="A", role="r", goal="g", backstory="b", client=client)
+
+    async def go():
+        with pytest.raises(ValueError):
+            await agent.ask_json("Return JSON please")
+        first = await agent.ask_json("Return JSON please")  # retry: a new call, not the memoized prose
+        second = await agent.ask_json("Return JSON please")  # memo hit
+        await client.aclose()
+        return first, second
+
+    assert asyncio.run(go()) == ({"ok": True}, {"ok": True})
+    assert len(calls) == 2
+
+def test_reuse_across_loops_warns_unless_closed():
+    client = make_client(lambda request: completion("hello"))
+
+    async def call():
+        return await client.chat(MESSAGES)
+
+    async def call_and_close():
+        async with client:
+            return await client.chat(MESSAGES)
+
+    asyncio.run(call())  # pool left open when this loop ends
+    with pytest.warns(ResourceWarning):
+        asyncio.run(call_and_close())
+
+    with warnings.catch_warnings():
+        warnings.simplefilter("error", ResourceWarning)
+        assert asyncio.run(call_and_close()) == "hello"  # closed in time: a fresh pool, no warning
+
+def test_mock_answers_are_fresh_copies():
+    agent = BaseAgent(name="A", role="r", goal="g", backstory="b", client=make_client(completion))
+    spec = agent.mock_response_obj("Transform this user story into a spec")
+    spec["title"] = "changed"
+    spec["entities"].clear()
+    assert agent.mock_response_obj("Transform this user story into a spec") == MOCK_SPEC
+    assert MOCK_SPEC["title"] == "User Management API" and MOCK_SPEC["entities"]
@@ -0,0 +1,82 @@
+import asyncio
+
+from agents.base_agent import BaseAgent
+from agents.orchestrator import Orchestrator
+
+SPEC = {"title": "Users", "entities": [{"name": "User"}]}
+CODE = {"app/main.py": "app = 1"}
+TESTS = {"tests/test_x.py": "def test_x(): pass"}
+
+
+def entries(files):
+    return [{"path": path, "content": content} for path, content in files.items()]
+
+class FakeRequirementsAgent:
+    def __init__(self):
+        self.calls = 0
+
+    async def generate_spec(self, user_story):
+        self.calls += 1
+        return dict(SPEC)
+
+class FakeFilesAgent:
+    """Stands in for CodeAgent / TestAgent; answer is what the batched ask_json returns (or raises)."""
+
+    def __init__(self, files, answer=None):
+        self.files = files
+        self.answer = answer
+        self.calls = 0
+        self.mock_fallbacks = 0
+
+    async def ask_json(self, prompt, temperature=0.2, schema=None, schema_name="response"):
+        if isinstance(self.answer, Exception):
+            raise self.answer
+        return self.answer
+
+    async def _generate(self):
+        self.calls += 1
+        return dict(self.files)
+
+    async def generate_code_files(self, spec_pretty, file_plan=()):
+        return await self._generate()
+
+    async def generate_tests(self, spec_pretty, generated_files):
+        return await self._generate()
+
+    def save_files(self, files, root_dir):
+        return BaseAgent._write_files(files, root_dir)
+
+def run_batched(tmp_path, answer):
+    req = FakeRequirementsAgent()
+    code = FakeFilesAgent(CODE, answer)
+    tests = FakeFilesAgent(TESTS)
+    orch = Orchestrator(req, code, tests, project_root=str(tmp_path))
+    result = asyncio.run(orch.run_batched("story"))
+    return result, (req.calls, code.calls, tests.calls)
+
+
+def test_truncated_answer_falls_back_to_run(tmp_path):
+    result, calls = run_batched(tmp_path, ValueError('CodeAgent returned non-JSON output: {"spec": {"ti'))
+    assert calls == (1, 1, 1)
+    assert result["spec"] == SPEC
+    assert result["code_written"] == ["app/main.py"]
+
+def test_complete_answer_uses_one_call(tmp_path):
+    big_spec = {"title": "Shop", "entities": [{"name": f"E{i}"} for i in range(5)]}
+    answer = {"spec": big_spec, "code_files": entries({"app/shop.py": "x = 1"}), "test_files": entries(TESTS)}
+    result, calls = run_batched(tmp_path, answer)
+    assert calls == (0, 0, 0)  # many entities, but the answer came back complete: nothing regenerated
+    assert result == {"spec": big_spec, "code_written": ["app/shop.py"], "tests_written": ["tests/test_x.py"]}
+    assert (tmp_path / "app" / "shop.py").read_text() == "x = 1"
+
+def test_missing_spec_falls_back_to_run(tmp_path):
+    result, calls = run_batched(tmp_path, {"code_files": entries(CODE), "test_files": entries(TESTS)})
+    assert calls == (1, 1, 1)
+    assert result["spec"] == SPEC
+
+def test_missing_files_reuse_the_batched_spec(tmp_path):
+    spec = {"title": "Notes", "entities": [{"name": "Note"}]}
+    result, calls = run_batched(tmp_path, {"spec": spec, "code_files": entries(CODE), "test_files": []})
+    assert calls == (0, 1, 1)  # no second requirements call
+    assert result["spec"] == spec
+    assert result["tests_written"] == ["tests/test_x.py"]
@@ -0,0 +1,88 @@
+import asyncio
+import os
+from types import SimpleNamespace
+
+from agents.base_agent import BaseAgent
+from agents.orchestrator import Orchestrator
+
+SPEC = {"title": "Users", "entities": [{"name": "User"}]}
+
+
+class FakeRequirementsAgent:
+    async def generate_spec(self, user_story):
+        return dict(SPEC)
+
+class FakeFilesAgent:
+    """Stands in for CodeAgent / TestAgent; mock=True simulates an offline fallback."""
+
+    def __init__(self, files, mock=False, model="m1"):
+        self.files = files
+        self.mock = mock
+        self.client = SimpleNamespace(cfg=SimpleNamespace(model=model))
+        self.calls = 0
+        self.mock_fallbacks = 0
+
+    async def _generate(self):
+        self.calls += 1
+        if self.mock:
+            self.mock_fallbacks += 1
+        return dict(self.files)
+
+    async def generate_code_files(self, spec_pretty, file_plan=()):
+        return await self._generate()
+
+    async def generate_tests(self, spec_pretty, generated_files):
+        return await self._generate()
+
+    def save_files(self, files, root_dir):
+        return BaseAgent._write_files(files, root_dir)
+
+def make_orchestrator(tmp_path, code_mock=False, test_mock=False):
+    code = FakeFilesAgent({"app/main.py": "app = 1"}, mock=code_mock)
+    tests = FakeFilesAgent({"tests/test_x.py": "def test_x(): pass"}, mock=test_mock)
+    orch = Orchestrator(
+        FakeRequirementsAgent(), code, tests, project_root=str(tmp_path), cache_dir=str(tmp_path / ".orch_cache")
+    )
+    return orch, code, tests
+
+
+def test_cache_miss_then_hit(tmp_path):
+    orch, code, tests = make_orchestrator(tmp_path)
+    first = asyncio.run(orch.run("story"))
+    second = asyncio.run(orch.run("story"))
+
+    assert first == second
+    assert second["code_written"] == ["app/main.py"]
+    assert second["tests_written"] == ["tests/test_x.py"]
+    assert (code.calls, tests.calls) == (1, 1)  # second run served from the cache
+    assert (tmp_path / "app" / "main.py").read_text() == "app = 1"
+
+def test_no_cache_dir_always_regenerates(tmp_path):
+    code = FakeFilesAgent({"app/main.py": "app = 1"})
+    tests = FakeFilesAgent({"tests/test_x.py": "x"})
+    orch = Orchestrator(FakeRequirementsAgent(), code, tests, project_root=str(tmp_path))
+    asyncio.run(orch.run("story"))
+    asyncio.run(orch.run("story"))
+    assert (code.calls, tests.calls) == (2, 2)
+
+def test_mock_output_is_not_cached(tmp_path):
+    orch, code, tests = make_orchestrator(tmp_path, test_mock=True)
+    asyncio.run(orch.run("story"))
+    assert not os.path.exists(tmp_path / ".orch_cache")
+
+    tests.mock = False
+    asyncio.run(orch.run("story"))
+    asyncio.run(orch.run("story"))
+    assert (code.calls, tests.calls) == (2, 2)  # real output from the second run was cached
+
+def test_model_or_prompt_change_is_a_miss(tmp_path, monkeypatch):
+    orch, code, tests = make_orchestrator(tmp_path)
+    asyncio.run(orch.run("story"))
+
+    code.client.cfg.model = "m2"
+    asyncio.run(orch.run("story"))
+    assert (code.calls, tests.calls) == (2, 2)
+
+    monkeypatch.setattr("agents.orchestrator.PROMPTS_VERSION", "edited")
+    asyncio.run(orch.run("story"))
+    assert (code.calls, tests.calls) == (3, 3)